@@ -8,8 +8,9 @@ import sys
 import typing as t
 
 from dotenv import load_dotenv
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolCall
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable
 from langchain_core.tools import BaseTool
 from langchain_groq import ChatGroq
 from mcp import ClientSession, StdioServerParameters
@@ -18,25 +19,40 @@ from mcp.client.stdio import stdio_client
 from langchain_mcp import MCPToolkit
 
 
+async def astream_collect(model: Runnable[t.Any, BaseMessage], messages: list[BaseMessage]) -> AIMessage:
+    # Print content as it streams in and merge the chunks (including tool call chunks) into one message.
+    # Mirrors siliconflow.tools.astream_collect; kept separate so this mypy-checked demo stays independent
+    # of the untyped siliconflow package and its aiohttp/orjson/langchain_openai imports. Keep both in sync.
+    aggregate: AIMessageChunk | None = None
+    async for chunk in model.astream(messages):
+        chunk = t.cast(AIMessageChunk, chunk)
+        print(chunk.content, end="", flush=True)
+        aggregate = chunk if aggregate is None else t.cast(AIMessageChunk, aggregate + chunk)
+    print()
+    return aggregate if aggregate is not None else AIMessage(content="")
+
+
 async def run(tools: list[BaseTool], prompt: str) -> str:
     try:
         print("Starting chat with Groq...")
         model = ChatGroq(model="llama-3.3-70b-versatile", stop_sequences=None)  # requires GROQ_API_KEY
-        tools_map = {tool.name: tool for tool in tools}
+        tools_map = {tool.name.lower(): tool for tool in tools}
         tools_model = model.bind_tools(tools)
         messages: list[BaseMessage] = [HumanMessage(prompt)]
-        ai_message = t.cast(AIMessage, await tools_model.ainvoke(messages))
+        ai_message = await astream_collect(tools_model, messages)
         messages.append(ai_message)
-        print(f"Received response: {ai_message.content}")
+        print(f"Received {len(ai_message.tool_calls)} tool call(s)")
 
-        # Process tool calls
-        for tool_call in ai_message.tool_calls:
+        async def invoke_tool(tool_call: ToolCall) -> t.Any:
             print(f"Executing tool: {tool_call['name']}")
             print(f"Tool arguments: {tool_call['arguments']}")
             selected_tool = tools_map[tool_call["name"].lower()]
             # Parse arguments as JSON
             args = json.loads(tool_call["arguments"])
-            tool_msg = await selected_tool.ainvoke(**args)
+            return await selected_tool.ainvoke(**args)
+
+        # Process tool calls concurrently, keeping results in call order
+        for tool_msg in await asyncio.gather(*(invoke_tool(tool_call) for tool_call in ai_message.tool_calls)):
             print(f"Tool result: {tool_msg.content}")
             messages.append(tool_msg)
 
@@ -1,31 +1,39 @@
+import functools
 import os
 import pathlib
 import sys
 
 from dotenv import load_dotenv
 
+# 项目根目录下的 .env 文件，导入时解析一次
+_ENV_PATH = pathlib.Path(__file__).resolve().parents[2] / ".env"
+_ENV_EXISTS = _ENV_PATH.exists()
 
-def load_config():
+
+@functools.lru_cache(maxsize=1)
+def load_config() -> dict[str, str]:
     # 检查.env文件是否存在
-    env_path = pathlib.Path(__file__).parent.parent.parent / ".env"
-    if not env_path.exists():
+    if not _ENV_EXISTS:
         print("\n错误: 未找到 .env 文件!")
         print("请在项目根目录创建 .env 文件，并添加以下配置:")
         print("SILICONFLOW_API_KEY=你的API密钥")
         print("SILICONFLOW_BASE_URL=https://api.siliconflow.cn/v1")
         sys.exit(1)
 
-    load_dotenv()
+    load_dotenv(_ENV_PATH)
 
     # 检查必要的环境变量
-    if not os.getenv("SILICONFLOW_API_KEY"):
+    api_key = os.getenv("SILICONFLOW_API_KEY")
+    base_url = os.getenv("SILICONFLOW_BASE_URL")
+
+    if not api_key:
         print("\n错误: 环境变量 SILICONFLOW_API_KEY 未设置!")
         print("请在 .env 文件中添加你的 API 密钥")
         sys.exit(1)
 
-    if not os.getenv("SILICONFLOW_BASE_URL"):
+    if not base_url:
         print("\n错误: 环境变量 SILICONFLOW_BASE_URL 未设置!")
         print("请在 .env 文件中添加 API 基础URL")
         sys.exit(1)
 
-    return {"api_key": os.getenv("SILICONFLOW_API_KEY"), "base_url": os.getenv("SILICONFLOW_BASE_URL")}
+    return {"api_key": api_key, "base_url": base_url}
@@ -8,12 +8,13 @@ sys.path.append(str(Path(__file__).parent))
 from config import load_config
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
-from models import ModelManager
+from models import ModelManager, close_session
 from tools import run_with_tools
 
 from langchain_mcp import MCPToolkit
 
 DEFAULT_MODEL = "Qwen/Qwen2.5-72B-Instruct"
+FALLBACK_MODEL = "Qwen/Qwen2.5-32B-Instruct"
 
 
 async def main(prompt: str) -> None:
@@ -23,12 +24,17 @@ async def main(prompt: str) -> None:
     # 初始化模型管理器
     model_manager = ModelManager(config["api_key"])
 
-    # 验证默认模型是否可用
-    if not model_manager.verify_model(DEFAULT_MODEL):
-        raise ValueError(
-            f"Preferred model {DEFAULT_MODEL} is not available. "
-            f"Available models: {model_manager.get_available_models()}"
-        )
+    # 一次性验证默认模型和备用模型，优先使用默认模型
+    try:
+        availability = await model_manager.verify_models([DEFAULT_MODEL, FALLBACK_MODEL])
+        model_name = next((name for name, available in availability.items() if available), None)
+        if model_name is None:
+            raise ValueError(
+                f"Neither {DEFAULT_MODEL} nor {FALLBACK_MODEL} is available. "
+                f"Available models: {await model_manager.aget_available_models()}"
+            )
+    finally:
+        await close_session()
 
     # 设置MCP服务器参数
     server_params = StdioServerParameters(
@@ -50,7 +56,7 @@ async def main(prompt: str) -> None:
             response = await run_with_tools(
                 tools=toolkit.get_tools(),
                 prompt=prompt,
-                model_name=DEFAULT_MODEL,
+                model_name=model_name,
                 base_url=config["base_url"],
                 api_key=config["api_key"],
             )
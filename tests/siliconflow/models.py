@@ -1,15 +1,97 @@
+import asyncio
+import hashlib
+import pathlib
 import time
+from collections.abc import Iterable
 
-import requests
+import aiohttp
+import orjson
+
+_SESSION: aiohttp.ClientSession | None = None
+_SESSION_LOCK = asyncio.Lock()
+
+# 连接3秒、读取10秒超时，避免服务器无响应时无限等待
+_TIMEOUT = aiohttp.ClientTimeout(connect=3.0, sock_read=10.0)
+# 网关类错误最多重试2次，间隔按指数退避
+_MAX_RETRIES = 2
+_BACKOFF_FACTOR = 0.3
+_RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    """获取共享的 HTTP 会话，复用连接池中的 TCP/TLS 连接"""
+    global _SESSION
+    async with _SESSION_LOCK:
+        if _SESSION is None or _SESSION.closed:
+            _SESSION = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300, keepalive_timeout=30),
+                timeout=_TIMEOUT,
+            )
+        return _SESSION
+
+
+async def _get_json(url: str, headers: dict[str, str], params: dict[str, str]) -> dict:
+    """发送 GET 请求并解析 JSON，遇到网关错误或连接失败时按指数退避重试"""
+    session = await _get_session()
+    attempt = 0
+    while True:
+        try:
+            async with session.get(url, headers=headers, params=params) as response:
+                if response.status not in _RETRY_STATUSES or attempt >= _MAX_RETRIES:
+                    response.raise_for_status()
+                    return await response.json()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt >= _MAX_RETRIES:
+                raise
+        await asyncio.sleep(_BACKOFF_FACTOR * 2**attempt)
+        attempt += 1
+
+
+async def close_session() -> None:
+    """关闭共享的 HTTP 会话"""
+    global _SESSION
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    _SESSION = None
 
 
 class ModelManager:
     def __init__(self, api_key: str):
         self._api_key = api_key
-        self._cache: dict = {"models": None, "last_update": None}
+        self._cache: dict = {"models": None, "models_set": frozenset(), "last_update": None}
         self.CACHE_DURATION = 24 * 60 * 60  # 24小时缓存
+        # 不同的 API 密钥可见的模型可能不同，缓存文件按密钥哈希区分
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        self._cache_path = pathlib.Path.home() / f".cache/langchain-mcp/siliconflow_models_{key_hash}.json"
+        self._from_disk = False
+        self._load_disk_cache()
+
+    def _load_disk_cache(self) -> None:
+        """从磁盘读取未过期的模型列表缓存，避免每次启动都请求API"""
+        try:
+            if time.time() - self._cache_path.stat().st_mtime >= self.CACHE_DURATION:
+                return
+            data = orjson.loads(self._cache_path.read_bytes())
+            self._cache["models"] = data["models"]
+            self._cache["models_set"] = frozenset(data["models"])
+            self._cache["last_update"] = data["last_update"]
+            self._from_disk = True
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading model cache: {e}")
 
-    def get_available_models(self) -> list[str]:
+    def _save_disk_cache(self) -> None:
+        """原子地将模型列表缓存写入磁盘"""
+        try:
+            self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._cache_path.with_suffix(".tmp")
+            tmp.write_bytes(orjson.dumps({"models": self._cache["models"], "last_update": self._cache["last_update"]}))
+            tmp.replace(self._cache_path)
+        except Exception as e:
+            print(f"Error saving model cache: {e}")
+
+    async def aget_available_models(self) -> list[str]:
         current_time = time.time()
 
         # 如果缓存存在且未过期，直接返回缓存的结果
@@ -26,14 +108,17 @@ class ModelManager:
         headers = {"Authorization": f"Bearer {self._api_key}"}
 
         try:
-            response = requests.request("GET", url, headers=headers, params=querystring)
-            response.raise_for_status()
-            models = response.json()
+            models = await _get_json(url, headers=headers, params=querystring)
             model_list = [model["id"] for model in models["data"]] if models.get("data") else []
 
             # 更新缓存
             self._cache["models"] = model_list
+            self._cache["models_set"] = frozenset(model_list)
             self._cache["last_update"] = current_time
+            self._from_disk = False
+            # 空列表多半是接口的临时异常，不写入磁盘以免影响之后24小时的运行
+            if model_list:
+                self._save_disk_cache()
 
             return model_list
         except Exception as e:
@@ -45,6 +130,18 @@ class ModelManager:
             # 如果没有缓存且API请求失败，返回空列表
             return []
 
-    def verify_model(self, model_name: str) -> bool:
-        available_models = self.get_available_models()
-        return model_name in available_models
+    async def verify_model(self, model_name: str) -> bool:
+        return (await self.verify_models([model_name]))[model_name]
+
+    async def verify_models(self, model_names: Iterable[str]) -> dict[str, bool]:
+        """一次性验证多个模型，所有模型共用同一次缓存检查和请求"""
+        model_names = list(model_names)
+        # 先确保缓存是最新的，再用集合做 O(1) 查找
+        await self.aget_available_models()
+        # 磁盘缓存可能已经过时，有模型缺失时重新请求一次再下结论
+        if self._from_disk and any(name not in self._cache["models_set"] for name in model_names):
+            self._from_disk = False
+            self._cache["last_update"] = None
+            await self.aget_available_models()
+        models_set = self._cache["models_set"]
+        return {model_name: model_name in models_set for model_name in model_names}
@@ -1,7 +1,9 @@
-import json
+import asyncio
 import typing as t
 
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+import orjson
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolCall
+from langchain_core.runnables import Runnable
 from langchain_core.tools import BaseTool
 from langchain_openai import ChatOpenAI
 
@@ -27,6 +29,11 @@ SYSTEM_PROMPT = """你是一个强大的AI助手，能够使用搜索工具来
 2. 避免复杂的查询组合
 3. 确保每次工具调用的参数都是有效的JSON"""
 
+# 工具结果和出错时的回复模板，不包含多余的缩进空白
+_TOOL_RESULT_TMPL = "搜索结果: {r}\n\n请分析这个结果，如果需要更多信息，使用更简单的关键词继续搜索。"
+_PARTIAL_RESULTS_TMPL = "虽然遇到了一些错误，但根据已有信息：\n{r}"
+_FINAL_SUMMARY_TMPL = "所有搜索结果：\n{r}\n\n请根据所有搜索结果，给出最终答案。如果信息不足，请说明。"
+
 
 def parse_tool_args(args: str | dict) -> dict:
     """解析工具调用参数"""
@@ -36,8 +43,8 @@ def parse_tool_args(args: str | dict) -> dict:
     if isinstance(args, str):
         try:
             # 尝试直接解析
-            return json.loads(args)
-        except json.JSONDecodeError as e:
+            return orjson.loads(args)
+        except ValueError as e:
             print(f"Error parsing JSON: {e}")
             try:
                 # 如果是字符串，直接构造查询
@@ -49,8 +56,80 @@ def parse_tool_args(args: str | dict) -> dict:
     return {"query": str(args)}
 
 
+def truncate_middle(text: str, max_chars: int = 4096) -> str:
+    """超出长度时截去文本中间部分，保留开头和结尾"""
+    if len(text) <= max_chars:
+        return text
+    marker = "...[truncated]..."
+    # 预算放不下标记时只保留开头部分
+    if max_chars <= len(marker):
+        return text[: max(max_chars, 0)]
+    head = (max_chars - len(marker)) // 2
+    tail = max_chars - len(marker) - head
+    return text[:head] + marker + text[len(text) - tail :]
+
+
+def prune_messages(messages: list[BaseMessage], *, keep_last: int = 4) -> list[BaseMessage]:
+    """组装发送给模型的上下文：保留系统消息、用户的原始问题以及最近的若干条消息"""
+    first_human = next((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), None)
+    window_start = len(messages) - keep_last
+    return [m for i, m in enumerate(messages) if i >= window_start or i == first_human or isinstance(m, SystemMessage)]
+
+
+# 搜索结果摘要消息的 id，用于在再次压缩时找到并替换它
+_FINDINGS_ID = "search-findings"
+
+
+def compact_search_messages(
+    messages: list[BaseMessage],
+    search_messages: list[BaseMessage],
+    search_results: list[str],
+    *,
+    keep_last: int = 2,
+    max_chars: int = 2048,
+) -> None:
+    """将较早的搜索结果消息合并为一条摘要 SystemMessage，原地修改 messages 和 search_messages
+
+    每条较早的结果分得相同的字符预算，不会因为前面的结果过长而丢掉后面的结果。
+    """
+    if len(search_messages) <= keep_last:
+        return
+    stale_ids = {id(m) for m in search_messages[:-keep_last]}
+    del search_messages[:-keep_last]
+    messages[:] = [m for m in messages if id(m) not in stale_ids and m.id != _FINDINGS_ID]
+
+    stale_results = search_results[:-keep_last]
+    budget = max_chars // len(stale_results)
+    findings = "\n".join(truncate_middle(result, budget) for result in stale_results)
+    messages.insert(1, SystemMessage(content=f"此前的搜索结果摘要：\n{findings}", id=_FINDINGS_ID))
+
+
+def tool_call_key(name: str, args: dict) -> tuple[str, bytes]:
+    """工具调用的去重键：小写的工具名加上按键排序后的参数"""
+    return name.lower(), orjson.dumps(args, option=orjson.OPT_SORT_KEYS)
+
+
+# 标记重复的工具调用（相同工具、相同参数），此类调用不会再次执行
+_DUPLICATE_CALL = object()
+
+
+async def astream_collect(model: Runnable[t.Any, BaseMessage], messages: list[BaseMessage]) -> AIMessage:
+    """流式调用模型，实时打印输出，并将所有分块合并为完整的 AIMessage
+
+    tests/demo.py 中有一份相同的实现（为了让该文件的 mypy 检查不依赖本包），修改时需同步。
+    """
+    aggregate: AIMessageChunk | None = None
+    async for chunk in model.astream(messages):
+        chunk = t.cast(AIMessageChunk, chunk)
+        print(chunk.content, end="", flush=True)
+        aggregate = chunk if aggregate is None else t.cast(AIMessageChunk, aggregate + chunk)
+    print()
+    return aggregate if aggregate is not None else AIMessage(content="")
+
+
 async def run_with_tools(tools: list[BaseTool], prompt: str, model_name: str, base_url: str, api_key: str) -> str:
     print("Available tools:", [tool.name for tool in tools])
+    tools_map = {tool.name.lower(): tool for tool in tools}
     print(f"Using model: {model_name}")
 
     model = ChatOpenAI(
@@ -60,7 +139,6 @@ async def run_with_tools(tools: list[BaseTool], prompt: str, model_name: str, ba
         temperature=0.3,  # 降低温度，使输出更加稳定
     )
 
-    tools_map = {tool.name: tool for tool in tools}
     tools_model = model.bind_tools(tools)
 
     messages: list[BaseMessage] = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=prompt)]
@@ -70,13 +148,47 @@ async def run_with_tools(tools: list[BaseTool], prompt: str, model_name: str, ba
     max_iterations = 10
     iteration = 0
     search_results = []
+    # 仍以完整形式保留在 messages 中的搜索结果消息
+    search_messages: list[BaseMessage] = []
+    # 已经成功执行过的工具调用
+    seen_calls: set[tuple[str, bytes]] = set()
+
+    async def _invoke_one(tool_call: ToolCall) -> t.Any:
+        nonlocal error_count
+        # 查找工具、解析参数的失败也算作该调用失败，而不是让整批 gather 中断
+        try:
+            name_lower = tool_call["name"].lower()
+            selected_tool = tools_map.get(name_lower)
+            if selected_tool is None:
+                raise ValueError(f"Unknown tool: {tool_call['name']}")
+
+            # 解析工具调用参数
+            tool_args = parse_tool_args(tool_call["args"])
+            print(f"Parsed tool args: {tool_args}")
+
+            # 跳过之前已经成功执行过的相同调用；失败的调用允许原样重试
+            key = tool_call_key(name_lower, tool_args)
+            if key in seen_calls:
+                print(f"Skipping duplicate tool call: {tool_call['name']} {tool_args}")
+                return _DUPLICATE_CALL
+
+            # 调用工具
+            tool_msg = await selected_tool.ainvoke(tool_args)
+            print(f"Tool response: {str(tool_msg)[:200]}...")
+            seen_calls.add(key)
+            return tool_msg
+        except Exception as e:
+            print(f"Error invoking tool: {e}")
+            error_count += 1
+            return e
 
     while iteration < max_iterations:
         iteration += 1
         print(f"\nIteration {iteration}")
 
         try:
-            ai_message = t.cast(AIMessage, await tools_model.ainvoke(messages))
+            # 只把滑动窗口内的消息发给模型；完整的搜索结果保存在 search_results 中
+            ai_message = await astream_collect(tools_model, prune_messages(messages))
 
             # 检查是否有工具调用
             if not (hasattr(ai_message, "tool_calls") and ai_message.tool_calls):
@@ -89,54 +201,63 @@ async def run_with_tools(tools: list[BaseTool], prompt: str, model_name: str, ba
                     continue
                 break
 
-            for tool_call in ai_message.tool_calls:
-                tool_name = tool_call["name"].lower()
-                selected_tool = tools_map[tool_name]
-
-                # 解析工具调用参数
-                tool_args = parse_tool_args(tool_call["args"])
-                print(f"Parsed tool args: {tool_args}")
-
-                try:
-                    # 调用工具
-                    tool_msg = await selected_tool.ainvoke(tool_args)
-                    print(f"Tool response: {str(tool_msg)[:200]}...")
-
-                    # 保存搜索结果
-                    search_results.append(str(tool_msg))
-
-                    messages.append(
-                        HumanMessage(
-                            content=f"""搜索结果: {str(tool_msg)}\n\n请分析这个结果，
-                            如果需要更多信息，使用更简单的关键词继续搜索。"""
-                        )
-                    )
-                except Exception as e:
-                    print(f"Error invoking tool: {e}")
-                    error_count += 1
-                    if error_count >= max_errors:
-                        if search_results:
-                            return "虽然遇到了一些错误，但根据已有信息：\n" + "\n".join(search_results)
-                        return "抱歉，在搜索过程中遇到了太多错误。请稍后再试。"
-                    messages.append(HumanMessage(content="请使用更简单的关键词重试。"))
+            # 并发执行本轮所有相互独立的工具调用，按原顺序处理结果
+            results = await asyncio.gather(*(_invoke_one(tool_call) for tool_call in ai_message.tool_calls))
+
+            # 如果本轮所有调用都是重复的，继续迭代也不会有新信息
+            if all(tool_msg is _DUPLICATE_CALL for tool_msg in results):
+                print("All tool calls were repeated, stopping early")
+                break
+
+            for tool_msg in results:
+                if tool_msg is _DUPLICATE_CALL:
+                    messages.append(HumanMessage(content="这个搜索已经执行过了，请换一个不同的关键词或搜索策略。"))
+                    continue
+
+                # 失败的调用在保存完本轮所有成功结果之后再统一处理
+                if isinstance(tool_msg, Exception):
+                    continue
+
+                # 保存搜索结果
+                tool_str = str(tool_msg)
+                search_results.append(tool_str)
+
+                search_message = HumanMessage(content=_TOOL_RESULT_TMPL.format(r=truncate_middle(tool_str)))
+                search_messages.append(search_message)
+                messages.append(search_message)
+
+            if any(isinstance(tool_msg, Exception) for tool_msg in results):
+                if error_count >= max_errors:
+                    if search_results:
+                        return _PARTIAL_RESULTS_TMPL.format(r="\n".join(search_results))
+                    return "抱歉，在搜索过程中遇到了太多错误。请稍后再试。"
+                messages.append(HumanMessage(content="请使用更简单的关键词重试。"))
+
+            # 搜索结果较多时，将较早的结果压缩为一条摘要消息，只保留最近两条完整结果
+            if len(search_results) >= 3:
+                compact_search_messages(messages, search_messages, search_results)
 
         except Exception as e:
             print(f"Error in conversation loop: {e}")
             error_count += 1
             if error_count >= max_errors:
                 if search_results:
-                    return "虽然遇到了一些错误，但根据已有信息：\n" + "\n".join(search_results)
+                    return _PARTIAL_RESULTS_TMPL.format(r="\n".join(search_results))
                 return "抱歉，在处理过程中遇到了错误。请稍后再试。"
             messages.append(HumanMessage(content="请使用更简单的搜索词重试。"))
             continue
 
-    # 如果有搜索结果，生成最终总结
+    # 如果有搜索结果，根据完整的搜索结果生成最终总结
     if search_results:
         try:
             final_message = t.cast(
                 AIMessage,
                 await tools_model.ainvoke(
-                    messages + [HumanMessage(content="请根据所有搜索结果，给出最终答案。如果信息不足，请说明。")]
+                    [
+                        SystemMessage(content=SYSTEM_PROMPT),
+                        HumanMessage(content=prompt),
+                        HumanMessage(content=_FINAL_SUMMARY_TMPL.format(r="\n\n".join(search_results))),
+                    ]
                 ),
             )
             return final_message.content
@@ -0,0 +1,126 @@
+# Copyright (C) 2024 Andrew Wason
+# SPDX-License-Identifier: MIT
+
+import pathlib
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from siliconflow import models
+from siliconflow.models import ModelManager
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setattr(pathlib.Path, "home", lambda: tmp_path)
+    return tmp_path
+
+
+def fake_get_json(monkeypatch, *responses):
+    """依次返回预设的模型列表，并记录请求次数"""
+    calls = []
+
+    async def get_json(url, headers, params):
+        calls.append(url)
+        return {"data": [{"id": model} for model in responses[min(len(calls), len(responses)) - 1]]}
+
+    monkeypatch.setattr(models, "_get_json", get_json)
+    return calls
+
+
+async def test_model_list_persisted_per_api_key(home, monkeypatch):
+    calls = fake_get_json(monkeypatch, ["model-a"])
+
+    assert await ModelManager("key-1").verify_model("model-a")
+    # 同一个密钥的新实例直接读取磁盘缓存
+    assert await ModelManager("key-1").verify_model("model-a")
+    assert len(calls) == 1
+
+    # 不同的密钥使用不同的缓存文件
+    await ModelManager("key-2").aget_available_models()
+    assert len(calls) == 2
+    assert len(list((home / ".cache/langchain-mcp").glob("siliconflow_models_*.json"))) == 2
+
+
+async def test_empty_model_list_not_persisted(home, monkeypatch):
+    calls = fake_get_json(monkeypatch, [], ["model-a"])
+
+    assert not await ModelManager("key").verify_model("model-a")
+    assert not list(home.glob(".cache/langchain-mcp/*.json"))
+    assert await ModelManager("key").verify_model("model-a")
+    assert len(calls) == 2
+
+
+async def test_missing_model_refetched_once_from_disk_cache(home, monkeypatch):
+    calls = fake_get_json(monkeypatch, ["model-a"], ["model-a", "model-b"])
+    await ModelManager("key").aget_available_models()
+
+    manager = ModelManager("key")
+    assert await manager.verify_models(["model-a", "model-b", "model-c"]) == {
+        "model-a": True,
+        "model-b": True,
+        "model-c": False,
+    }
+    assert len(calls) == 2
+
+    # 刷新过一次之后不再为缺失的模型重复请求
+    assert not await manager.verify_model("model-c")
+    assert len(calls) == 2
+
+
+async def serve_statuses(*statuses):
+    """启动本地服务器，依次返回给定的状态码，之后一直返回 200"""
+    remaining = list(statuses)
+
+    async def handler(request):
+        if remaining:
+            return web.Response(status=remaining.pop(0))
+        return web.json_response({"data": [{"id": "model-a"}]})
+
+    app = web.Application()
+    app.router.add_get("/models", handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server, remaining
+
+
+@pytest_asyncio.fixture(loop_scope="function")
+async def no_backoff(monkeypatch):
+    monkeypatch.setattr(models, "_BACKOFF_FACTOR", 0)
+    yield
+    await models.close_session()
+
+
+async def test_get_json_retries_gateway_errors(no_backoff):
+    server, remaining = await serve_statuses(502, 503)
+    try:
+        data = await models._get_json(str(server.make_url("/models")), headers={}, params={})
+    finally:
+        await server.close()
+    assert data == {"data": [{"id": "model-a"}]}
+    assert remaining == []
+
+
+async def test_get_json_gives_up_after_max_retries(no_backoff):
+    server, remaining = await serve_statuses(504, 504, 504, 504)
+    try:
+        with pytest.raises(aiohttp.ClientResponseError) as excinfo:
+            await models._get_json(str(server.make_url("/models")), headers={}, params={})
+    finally:
+        await server.close()
+    assert excinfo.value.status == 504
+    # 首次请求加两次重试
+    assert len(remaining) == 1
+
+
+async def test_get_json_does_not_retry_client_errors(no_backoff):
+    server, remaining = await serve_statuses(401, 502)
+    try:
+        with pytest.raises(aiohttp.ClientResponseError) as excinfo:
+            await models._get_json(str(server.make_url("/models")), headers={}, params={})
+    finally:
+        await server.close()
+    assert excinfo.value.status == 401
+    assert remaining == [502]
@@ -0,0 +1,164 @@
+# Copyright (C) 2024 Andrew Wason
+# SPDX-License-Identifier: MIT
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import StructuredTool
+from siliconflow import tools as siliconflow_tools
+from siliconflow.tools import (
+    compact_search_messages,
+    prune_messages,
+    run_with_tools,
+    tool_call_key,
+    truncate_middle,
+)
+
+
+def test_truncate_middle_short_text_unchanged():
+    assert truncate_middle("abc", max_chars=10) == "abc"
+
+
+def test_truncate_middle_keeps_head_and_tail():
+    text = "a" * 50 + "b" * 50
+    result = truncate_middle(text, max_chars=40)
+    assert len(result) == 40
+    assert result.startswith("a")
+    assert result.endswith("b")
+    assert "...[truncated]..." in result
+
+
+def test_truncate_middle_tiny_budget():
+    text = "x" * 100
+    assert truncate_middle(text, max_chars=5) == "xxxxx"
+    assert truncate_middle(text, max_chars=0) == ""
+    # 只够放下标记和一个字符时，尾部保留一个字符而不是整段文本
+    result = truncate_middle("a" * 50 + "z", max_chars=len("...[truncated]...") + 1)
+    assert result == "...[truncated]...z"
+
+
+def test_prune_messages_keeps_system_prompt_and_window():
+    system = SystemMessage(content="system")
+    prompt = HumanMessage(content="prompt")
+    findings = SystemMessage(content="findings")
+    history = [HumanMessage(content=f"m{i}") for i in range(6)]
+    messages = [system, findings, prompt, *history]
+
+    pruned = prune_messages(messages, keep_last=2)
+
+    assert pruned == [system, findings, prompt, history[-2], history[-1]]
+
+
+def test_prune_messages_short_transcript_unchanged():
+    messages = [SystemMessage(content="system"), HumanMessage(content="prompt"), AIMessage(content="answer")]
+    assert prune_messages(messages) == messages
+
+
+def test_tool_call_key_ignores_name_case_and_arg_order():
+    assert tool_call_key("Search", {"a": 1, "b": 2}) == tool_call_key("search", {"b": 2, "a": 1})
+    assert tool_call_key("search", {"a": 1}) != tool_call_key("search", {"a": 2})
+
+
+def test_compact_search_messages_keeps_every_stale_result():
+    search_results = ["A" * 4000, "B" * 4000, "C" * 4000, "D"]
+    search_messages: list[BaseMessage] = [HumanMessage(content=r) for r in search_results]
+    system, prompt = SystemMessage(content="system"), HumanMessage(content="prompt")
+    messages: list[BaseMessage] = [system, prompt, *search_messages]
+
+    compact_search_messages(messages, search_messages, search_results, max_chars=300)
+
+    findings = messages[1]
+    assert isinstance(findings, SystemMessage)
+    assert messages == [system, findings, prompt, *search_messages]
+    assert search_messages == messages[-2:]
+    # 每条较早的结果都保留了开头和结尾
+    assert all(ch in findings.content for ch in "AB")
+    assert len(findings.content) < 400
+
+    # 再次压缩时替换旧摘要，而不是追加新的摘要
+    search_results.append("E")
+    search_messages.append(HumanMessage(content="E"))
+    messages.append(search_messages[-1])
+    compact_search_messages(messages, search_messages, search_results, max_chars=300)
+
+    assert sum(isinstance(m, SystemMessage) for m in messages) == 2
+    assert all(ch in messages[1].content for ch in "ABC")
+    assert [m.content for m in messages[-2:]] == ["D", "E"]
+
+
+def test_compact_search_messages_noop_within_window():
+    search_messages: list[BaseMessage] = [HumanMessage(content="A"), HumanMessage(content="B")]
+    messages: list[BaseMessage] = [SystemMessage(content="system"), *search_messages]
+    compact_search_messages(messages, search_messages, ["A", "B"])
+    assert len(messages) == 3
+
+
+class FakeChatModel:
+    """按顺序返回预设回复的模型，并记录最终总结收到的消息"""
+
+    def __init__(self, replies: list[AIMessage]) -> None:
+        self.replies = iter(replies)
+        self.final_messages: list[BaseMessage] | None = None
+
+    def __call__(self, **kwargs: object) -> "FakeChatModel":
+        return self
+
+    def bind_tools(self, tools: object) -> RunnableLambda:
+        async def respond(messages: list[BaseMessage]) -> AIMessage:
+            reply = next(self.replies, None)
+            if reply is None:
+                self.final_messages = messages
+                return AIMessage(content="final answer")
+            return reply
+
+        return RunnableLambda(respond)
+
+
+async def test_run_with_tools_retries_failed_call_and_skips_repeated_success(monkeypatch):
+    calls = []
+
+    async def search(query: str) -> str:
+        calls.append(query)
+        if len(calls) == 1:
+            raise RuntimeError("transient failure")
+        return f"result for {query}"
+
+    tool = StructuredTool.from_function(coroutine=search, name="search", description="search the web")
+    tool_call = AIMessage(content="", tool_calls=[{"name": "search", "args": {"query": "a"}, "id": "1"}])
+    fake_model = FakeChatModel([tool_call, tool_call, tool_call])
+    monkeypatch.setattr(siliconflow_tools, "ChatOpenAI", fake_model)
+
+    answer = await run_with_tools([tool], "question", model_name="fake", base_url="http://fake", api_key="key")
+
+    # 第一次失败后允许原样重试；成功之后的相同调用被跳过，循环提前结束
+    assert calls == ["a", "a"]
+    assert answer == "final answer"
+    assert fake_model.final_messages is not None
+    assert "result for a" in fake_model.final_messages[-1].content
+
+
+async def test_run_with_tools_keeps_results_when_batch_has_unknown_tool(monkeypatch):
+    calls = []
+
+    async def search(query: str) -> str:
+        calls.append(query)
+        return f"result for {query}"
+
+    tool = StructuredTool.from_function(coroutine=search, name="search", description="search the web")
+    mixed_batch = AIMessage(
+        content="",
+        tool_calls=[
+            {"name": "search", "args": {"query": "a"}, "id": "1"},
+            {"name": "web_search", "args": {"query": "b"}, "id": "2"},
+        ],
+    )
+    repeat = AIMessage(content="", tool_calls=[{"name": "search", "args": {"query": "a"}, "id": "3"}])
+    fake_model = FakeChatModel([mixed_batch, repeat])
+    monkeypatch.setattr(siliconflow_tools, "ChatOpenAI", fake_model)
+
+    answer = await run_with_tools([tool], "question", model_name="fake", base_url="http://fake", api_key="key")
+
+    # 未知工具只让它自己失败，同一批中成功的搜索结果被保留
+    assert calls == ["a"]
+    assert answer == "final answer"
+    assert fake_model.final_messages is not None
+    assert "result for a" in fake_model.final_messages[-1].content